@@ -2,10 +2,12 @@
 Data Manager module for handling Google Sheets data loading and saving
 """
 
+import numpy as np
 import pandas as pd
 import gspread
 from google.oauth2.service_account import Credentials
 import datetime
+import hashlib
 
 
 class DataManager:
@@ -19,8 +21,18 @@ class DataManager:
         """
         self.sheet_id = sheet_id
         self.credentials_file = credentials_file
+        self._pending_writes = []
+        self._pending_clears = []
+        self._worksheet_titles = None
         self.connect_to_sheets()
         
+    def __getstate__(self):
+        """Drop the Sheets connection when pickling, e.g. for worker processes"""
+        state = self.__dict__.copy()
+        state.pop('client', None)
+        state.pop('sheet', None)
+        return state
+    
     def connect_to_sheets(self):
         """Establish connection to Google Sheets"""
         scope = ["https://www.googleapis.com/auth/spreadsheets"]
@@ -33,30 +45,88 @@ class DataManager:
         """Load all necessary data from Google Sheets"""
         print("Loading data from Google Sheets...")
         
+        # Fetch all input worksheets in a single batchGet request
+        response = self.sheet.values_batch_get(
+            ranges=["Machines", "ToUPrices", "Incentives", "SystemParams"],
+            params={"valueRenderOption": "UNFORMATTED_VALUE"}
+        )
+        machines_values, tou_values, incentive_values, system_values = [
+            value_range.get('values', []) for value_range in response['valueRanges']
+        ]
+        
         # Load machine parameters
-        machine_sheet = self.sheet.worksheet("Machines")
-        self.machines_df = pd.DataFrame(machine_sheet.get_all_records())
+        self.machines_df = self._values_to_dataframe(machines_values)
         print(f"Loaded {len(self.machines_df)} machines")
         
         # Load time-of-use electricity prices
-        tou_sheet = self.sheet.worksheet("ToUPrices")
-        self.tou_df = pd.DataFrame(tou_sheet.get_all_records())
+        self.tou_df = self._values_to_dataframe(tou_values)
         print(f"Loaded {len(self.tou_df)} time slots with ToU prices")
         
         # Load incentives if any
-        incentive_sheet = self.sheet.worksheet("Incentives")
-        self.incentive_df = pd.DataFrame(incentive_sheet.get_all_records())
+        self.incentive_df = self._values_to_dataframe(incentive_values)
         print(f"Loaded {len(self.incentive_df)} time slots with incentives")
         
         # Load system parameters
-        system_sheet = self.sheet.worksheet("SystemParams")
-        system_params_records = system_sheet.get_all_records()
-        self.system_params = {row['Parameter']: row['Value'] for row in system_params_records}
+        system_params_df = self._values_to_dataframe(system_values)
+        if {'Parameter', 'Value'}.issubset(system_params_df.columns):
+            self.system_params = dict(zip(system_params_df['Parameter'].tolist(),
+                                          system_params_df['Value'].tolist()))
+        else:
+            self.system_params = {}
         print(f"Loaded system parameters: {list(self.system_params.keys())}")
         
         # Parse parameters
         self.parse_parameters()
     
+    @staticmethod
+    def _values_to_dataframe(values):
+        """
+        Build a DataFrame from worksheet values whose first row is the header
+        
+        Args:
+            values: List of rows as returned by the Sheets values API
+            
+        Returns:
+            DataFrame with one column per header cell
+        """
+        if not values:
+            return pd.DataFrame()
+        
+        header, rows = values[0], values[1:]
+        width = len(header)
+        # The API drops trailing empty cells, so pad short rows back to the header width
+        rows = [row[:width] + [''] * (width - len(row)) for row in rows]
+        return pd.DataFrame(rows, columns=header)
+    
+    @staticmethod
+    def _parse_flag(name, value, default):
+        """
+        Parse an on/off system parameter
+        
+        Args:
+            name: Parameter name, used in the warning for unrecognised values
+            value: Cell value, a bool, 0/1 or a true/false style string
+            default: Value used when the cell is blank or unrecognised
+            
+        Returns:
+            Boolean value of the parameter
+        """
+        if value is None or value == '':
+            return default
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, (int, float)) and value in (0, 1):
+            return bool(value)
+        
+        text = str(value).strip().lower()
+        if text in ('1', 'true', 'yes', 'on'):
+            return True
+        if text in ('0', 'false', 'no', 'off'):
+            return False
+        
+        print(f"Warning: Unrecognised value {value!r} for {name}. Using default value of {default}")
+        return default
+    
     def parse_parameters(self):
         """Parse loaded data into model parameters"""
         print("Parsing parameters...")
@@ -70,27 +140,56 @@ class DataManager:
         
         print(f"Time slots: {self.T}, Machines: {self.I}, Systems: {self.S}")
         
-        # Create parameter dictionaries
-        self.R = {(row['MachineID'], row['SystemID']): float(row['RatedPower']) 
-                 for _, row in self.machines_df.iterrows()}
-        
-        self.N = {(row['MachineID'], row['SystemID']): int(row['OperationSlots']) 
-                 for _, row in self.machines_df.iterrows()}
+        # Create parameter dictionaries from a single columnar extraction
+        machine_arr = self.machines_df[['MachineID', 'SystemID', 'RatedPower',
+                                        'OperationSlots', 'EarlyTimeSlot', 'LateTimeSlot']].to_numpy()
+        keys = list(zip(machine_arr[:, 0].astype(int).tolist(), machine_arr[:, 1].astype(int).tolist()))
         
-        self.E = {(row['MachineID'], row['SystemID']): int(row['EarlyTimeSlot']) 
-                 for _, row in self.machines_df.iterrows()}
+        self.R = dict(zip(keys, machine_arr[:, 2].astype(float).tolist()))
+        self.N = dict(zip(keys, machine_arr[:, 3].astype(int).tolist()))
+        self.E = dict(zip(keys, machine_arr[:, 4].astype(int).tolist()))
+        self.L = dict(zip(keys, machine_arr[:, 5].astype(int).tolist()))
         
-        self.L = {(row['MachineID'], row['SystemID']): int(row['LateTimeSlot']) 
-                 for _, row in self.machines_df.iterrows()}
+        # Machine-system pairs that exist, grouped per system in machine order, so
+        # loops only visit valid pairs instead of every (i, s) combination
+        self.R_keys_by_system = {s: [] for s in range(1, self.S + 1)}
+        for i, s in sorted(self.R, key=lambda key: (key[1], key[0])):
+            if s in self.R_keys_by_system and 1 <= i <= self.I:
+                self.R_keys_by_system[s].append(i)
+        self.R_keys = [(i, s) for s, machines in self.R_keys_by_system.items() for i in machines]
         
         # Time-of-use prices
-        self.c = {row['TimeSlot']: float(row['Price']) for _, row in self.tou_df.iterrows()}
+        self.c = self._time_slot_dict(self.tou_df, 'Price')
         
         # Incentives
-        self.o = {row['TimeSlot']: float(row['Incentive']) for _, row in self.incentive_df.iterrows()}
+        self.o = self._time_slot_dict(self.incentive_df, 'Incentive')
+        
+        # Dense coefficient arrays indexed directly by MachineID/SystemID/TimeSlot
+        # (index 0 is unused padding so that 1-based IDs can be used as-is)
+        self.R_arr = np.zeros((self.I + 1, self.S + 1))
+        machine_ids = machine_arr[:, 0].astype(int)
+        system_ids = machine_arr[:, 1].astype(int)
+        valid = (machine_ids >= 1) & (machine_ids <= self.I) & (system_ids >= 1) & (system_ids <= self.S)
+        self.R_arr[machine_ids[valid], system_ids[valid]] = machine_arr[valid, 2].astype(float)
+        
+        self.c_arr = self._time_slot_array(self.tou_df, 'Price')
+        self.o_arr = self._time_slot_array(self.incentive_df, 'Incentive')
+        
+        # The dense arrays are shared by the model builder and result extractor,
+        # so guard them against accidental in-place modification
+        for values in (self.R_arr, self.c_arr, self.o_arr):
+            values.setflags(write=False)
+        
+        # Time slots whose price or incentive can contribute to the budget
+        self.nonzero_c_slots = (np.flatnonzero(self.c_arr[1:]) + 1).tolist()
+        self.nonzero_o_slots = (np.flatnonzero(self.o_arr[1:]) + 1).tolist()
         
         # System parameters
         self.alpha = float(self.system_params.get('alpha', 0.25))  # Default 15 min (0.25 hour) time slots
+        # Uninterruptible operation is enforced by default; it is only dropped for
+        # models without machine dependencies when explicitly set to 0
+        self.enforce_uninterruptible = self._parse_flag(
+            'enforce_uninterruptible', self.system_params.get('enforce_uninterruptible'), default=True)
         self.A = {}
         for s in range(1, self.S + 1):
             budget_key = f'A_{s}'
@@ -101,6 +200,23 @@ class DataManager:
                 self.A[s] = 5000.0
                 print(f"Warning: Budget for system {s} not found. Using default value of {self.A[s]}")
     
+    def _time_slot_dict(self, df, column):
+        """Build a {TimeSlot: value} dictionary from a per-time-slot column"""
+        if len(df) == 0:
+            return {}
+        return dict(zip(df['TimeSlot'].to_numpy().astype(int).tolist(),
+                        df[column].to_numpy().astype(float).tolist()))
+    
+    def _time_slot_array(self, df, column):
+        """Build a dense array of a per-time-slot column, zero where no value is given"""
+        values = np.zeros(self.T + 1)
+        if len(df) == 0:
+            return values
+        slots = df['TimeSlot'].to_numpy().astype(int)
+        valid = (slots >= 1) & (slots <= self.T)
+        values[slots[valid]] = df[column].to_numpy().astype(float)[valid]
+        return values
+    
     def get_machine_dependencies(self):
         """Extract machine dependencies from the data"""
         machine_dependencies = {}
@@ -113,10 +229,34 @@ class DataManager:
         
         return machine_dependencies
     
+    def get_input_hash(self):
+        """
+        Compute a hash of all parameters that define the optimization model
+        
+        Returns:
+            Hex digest identifying the current model inputs
+        """
+        inputs = (
+            sorted(self.R.items()),
+            sorted(self.N.items()),
+            sorted(self.E.items()),
+            sorted(self.L.items()),
+            sorted(self.c.items()),
+            sorted(self.o.items()),
+            self.alpha,
+            self.enforce_uninterruptible,
+            sorted(self.A.items()),
+            sorted(self.get_machine_dependencies().items()),
+        )
+        return hashlib.blake2b(repr(inputs).encode(), digest_size=16).hexdigest()
+    
     def save_worksheet_data(self, title, data, rows=20, cols=10, header_text=None):
         """
         Save data to a worksheet, creating it if it doesn't exist
         
+        Clearing and writing are queued and done by the next call to
+        flush_writes, so that all worksheets are updated in batch requests.
+        
         Args:
             title: Worksheet title
             data: List of lists containing the data
@@ -125,20 +265,49 @@ class DataManager:
             header_text: Optional header text to add at the top
         """
         try:
-            try:
-                worksheet = self.sheet.worksheet(title)
-                worksheet.clear()
-            except gspread.exceptions.WorksheetNotFound:
-                worksheet = self.sheet.add_worksheet(title=title, rows=rows, cols=cols)
+            # Worksheet titles are fetched once and kept up to date as sheets are added
+            if self._worksheet_titles is None:
+                self._worksheet_titles = {worksheet.title for worksheet in self.sheet.worksheets()}
             
-            # Add header if provided
+            if title in self._worksheet_titles:
+                self._pending_clears.append(f"'{title}'")
+            else:
+                self.sheet.add_worksheet(title=title, rows=rows, cols=cols)
+                self._worksheet_titles.add(title)
+            
+            # Add header if provided, leaving a blank row before the data
             if header_text:
-                worksheet.update_cell(1, 1, header_text)
-                worksheet.update(data, range_name='A3')
+                values = [[header_text], []] + data
             else:
-                worksheet.update(data)
-                
+                values = data
+            
+            self._pending_writes.append({'range': f"'{title}'!A1", 'values': values})
             return True
         except Exception as e:
             print(f"Error saving data to worksheet '{title}': {e}")
-            return False
\ No newline at end of file
+            return False
+    
+    def flush_writes(self):
+        """
+        Clear and write all queued worksheets with one batch request each
+        
+        Returns:
+            Boolean indicating success or failure
+        """
+        if not self._pending_writes and not self._pending_clears:
+            return True
+        
+        try:
+            if self._pending_clears:
+                self.sheet.values_batch_clear(body={'ranges': self._pending_clears})
+                self._pending_clears = []
+            
+            self.sheet.values_batch_update({
+                'valueInputOption': 'RAW',
+                'data': self._pending_writes
+            })
+            self._pending_writes = []
+            return True
+        except Exception as e:
+            print(f"Error writing queued worksheet data: {e}")
+            return False
@@ -3,6 +3,7 @@ Main entry point for the Multi-Objective Optimization for Air Compressor Schedul
 """
 
 import os
+from concurrent.futures import ProcessPoolExecutor
 from data_manager import DataManager
 from optimization_approaches import OptimizationApproaches
 from results_manager import ResultsManager
@@ -28,20 +29,24 @@ def main():
     results_manager = ResultsManager(data_manager)
     
     # Run the optimization approaches
+    # The approaches are independent, so each one is solved in its own process
     print("\nRunning optimization approaches...")
-    ec_first_results = optimizer.solve_preemptive_EC_first()
-    pl_first_results = optimizer.solve_preemptive_PL_first()
-    ws_results = optimizer.solve_weighted_sum(w_EC=0.7, w_PL=0.3)  # More emphasis on electricity cost
-    cp_results = optimizer.solve_compromise_programming(w_EC=0.5, w_PL=0.5)  # Equal weights
-    
-    # Collect all results
-    all_results = {
-        'PR_EC_first': ec_first_results,
-        'PR_PL_first': pl_first_results,
-        'WS': ws_results,
-        'CP': cp_results
+    approaches = {
+        'PR_EC_first': (optimizer.solve_preemptive_EC_first, {}),
+        'PR_PL_first': (optimizer.solve_preemptive_PL_first, {}),
+        'WS': (optimizer.solve_weighted_sum, {'w_EC': 0.7, 'w_PL': 0.3}),  # More emphasis on electricity cost
+        'CP': (optimizer.solve_compromise_programming, {'w_EC': 0.5, 'w_PL': 0.5})  # Equal weights
     }
     
+    # Share the CPUs between the parallel solves rather than oversubscribing them
+    optimizer.set_solver_threads(max(1, (os.cpu_count() or 1) // len(approaches)))
+    
+    with ProcessPoolExecutor(max_workers=len(approaches)) as executor:
+        futures = {name: executor.submit(solve, **kwargs) for name, (solve, kwargs) in approaches.items()}
+        
+        # Collect all results
+        all_results = {name: future.result() for name, future in futures.items()}
+    
     # Compare and visualize results
     comparison_df = results_manager.compare_approaches(all_results)
     results_manager.plot_comparison(all_results)
@@ -2,10 +2,27 @@
 Model Builder module for creating optimization models
 """
 
+import numpy as np
 import pulp as pl
 
 
+class WindowedVariables(dict):
+    """
+    Decision variables that only exist inside the machine windows
+    
+    Looking up any other (i, t, s) returns 0 rather than raising KeyError, so
+    expressions over the full grid leave those slots out entirely.
+    """
+    
+    def __missing__(self, key):
+        return 0
+
+
 class ModelBuilder:
+    # Bumped whenever the formulation or objectives change how optima come out,
+    # so that results cached for an older model are not reused
+    MODEL_VERSION = 1
+    
     @staticmethod
     def build_base_model(data_manager, name="Base_Model"):
         """
@@ -17,7 +34,8 @@ class ModelBuilder:
             
         Returns:
             model: The PuLP optimization model
-            x, y, u: Decision variables
+            x, y: Decision variables inside the machine windows, 0 elsewhere
+            u: Finish-marker variables
             e: Energy consumption variables
             PL: Peak load variable
         """
@@ -28,119 +46,204 @@ class ModelBuilder:
         I = data_manager.I  # Number of machines
         T = data_manager.T  # Number of time slots
         S = data_manager.S  # Number of systems
-        R = data_manager.R  # Rated power
+        R_arr = data_manager.R_arr  # Rated power as a dense [i, s] array
         E = data_manager.E  # Early time slot
         L = data_manager.L  # Late time slot
         N = data_manager.N  # Operation slots
-        c = data_manager.c  # ToU prices
-        o = data_manager.o  # Incentives
+        c_arr = data_manager.c_arr  # ToU prices as a dense [t] array
+        o_arr = data_manager.o_arr  # Incentives as a dense [t] array
         alpha = data_manager.alpha  # Time slot duration
         A = data_manager.A  # Budget
         
         # Create decision variables
-        x = pl.LpVariable.dicts("x", 
-                               [(i, t, s) for i in range(1, I + 1) 
-                                          for t in range(1, T + 1)
-                                          for s in range(1, S + 1)],
-                               cat=pl.LpBinary)
-        
-        y = pl.LpVariable.dicts("y", 
-                               [(i, t, s) for i in range(1, I + 1) 
-                                          for t in range(1, T + 1)
-                                          for s in range(1, S + 1)],
-                               cat=pl.LpBinary)
-        
-        u = pl.LpVariable.dicts("u", 
-                               [(i, t, s) for i in range(1, I + 1) 
-                                          for t in range(1, T + 1)
-                                          for s in range(1, S + 1)],
-                               cat=pl.LpBinary)
+        # E and L are hard operating limits: machines can only run inside their
+        # [E, L] window, so x and y only exist there and read as 0 elsewhere
+        x = WindowedVariables()
+        y = WindowedVariables()
+        for (i, s) in ModelBuilder._machine_windows(E, L, T, data_manager.R_keys):
+            for t in range(E[(i, s)], L[(i, s)] + 1):
+                x[(i, t, s)] = pl.LpVariable(f"x_{i}_{t}_{s}", cat=pl.LpBinary)
+                y[(i, t, s)] = pl.LpVariable(f"y_{i}_{t}_{s}", cat=pl.LpBinary)
+        
+        # u marks a machine as finished and is needed over the whole horizon,
+        # as successors may depend on it after the machine's window has closed.
+        # It is only left out when uninterruptible operation has been switched off
+        # explicitly and there are no dependencies
+        machine_dependencies = data_manager.get_machine_dependencies()
+        uninterruptible = bool(machine_dependencies) or data_manager.enforce_uninterruptible
+        if uninterruptible:
+            u = pl.LpVariable.dicts("u", 
+                                   [(i, t, s) for i in range(1, I + 1) 
+                                              for t in range(1, T + 1)
+                                              for s in range(1, S + 1)],
+                                   cat=pl.LpBinary)
+        else:
+            u = {}
+        
+        # Nested lists indexed [i][t][s] for tuple-free lookups in the constraint
+        # loops (None where x does not exist)
+        x_mat = [[[None] * (S + 2) for _ in range(T + 2)] for _ in range(I + 2)]
+        for (i, t, s), var in x.items():
+            x_mat[i][t][s] = var
+        u_mat = [[[None] * (S + 2) for _ in range(T + 2)] for _ in range(I + 2)]
+        for (i, t, s), var in u.items():
+            u_mat[i][t][s] = var
         
         e = pl.LpVariable.dicts("e", range(1, T + 1), lowBound=0)
         PL = pl.LpVariable("PL", lowBound=0)
         
         # Add constraints
-        ModelBuilder._add_electricity_consumption_constraints(model, e, x, R, T, S, I)
-        ModelBuilder._add_peak_load_constraints(model, PL, e, T)
-        ModelBuilder._add_budget_constraints(model, x, y, R, c, o, alpha, A, T, I, S)
-        ModelBuilder._add_operation_duration_constraints(model, x, E, L, N, S, I)
-        ModelBuilder._add_uninterruptible_operation_constraints(model, x, u, S, I, T)
-        ModelBuilder._add_machine_dependency_constraints(model, x, u, data_manager.get_machine_dependencies(), T)
+        ModelBuilder._add_aggregate_constraints(model, x, y, e, PL, R_arr, c_arr, o_arr, alpha, A, T, S,
+                                                data_manager.nonzero_c_slots, data_manager.nonzero_o_slots)
+        ModelBuilder._add_operation_duration_constraints(model, x, E, L, N, data_manager.R_keys)
+        if uninterruptible:
+            ModelBuilder._add_uninterruptible_operation_constraints(model, x_mat, u_mat, S, I, T)
+            ModelBuilder._add_machine_dependency_constraints(model, x_mat, u_mat, machine_dependencies, T)
         ModelBuilder._add_incentive_constraints(model, x, y, S, I, T)
         
         return model, x, y, u, e, PL
     
     @staticmethod
-    def _add_electricity_consumption_constraints(model, e, x, R, T, S, I):
-        """Add electricity consumption calculation constraints"""
-        for t in range(1, T + 1):
-            model += (e[t] == pl.lpSum([R.get((i, s), 0) * x[(i, t, s)]
-                                       for s in range(1, S + 1)
-                                       for i in range(1, I + 1)]),
-                     f"Electricity_Consumption_{t}")
+    def clone_base(cached, name):
+        """
+        Create a fresh copy of a previously built base model
+        
+        The copy shares variables and base constraints with the cached model
+        but has its own constraint list and no objective, so approach-specific
+        constraints and objectives can be added without rebuilding the model.
+        
+        Args:
+            cached: Tuple returned by build_base_model
+            name: Name for the copied optimization model
+            
+        Returns:
+            model: The copied PuLP optimization model
+            x, y, u: Decision variables
+            e: Energy consumption variables
+            PL: Peak load variable
+        """
+        base_model, x, y, u, e, PL = cached
+        
+        model = base_model.copy()
+        model.name = name
+        model.objective = None
+        
+        return model, x, y, u, e, PL
     
     @staticmethod
-    def _add_peak_load_constraints(model, PL, e, T):
-        """Add peak load constraints"""
-        for t in range(1, T + 1):
-            model += (PL >= e[t], f"Peak_Load_{t}")
+    def _machine_windows(E, L, T, R_keys):
+        """Return the (i, s) pairs whose [E, L] window lies within the time horizon"""
+        return [(i, s) for (i, s) in R_keys
+                if (i, s) in E and (i, s) in L
+                and 1 <= E[(i, s)] <= L[(i, s)] <= T]
+    
+    @staticmethod
+    def _compute_budget_coefs(keys, R_arr, c_arr, o_arr, alpha):
+        """
+        Compute the power and budget coefficients of the windowed variables at once
+        
+        Args:
+            keys: (i, t, s) keys of the x and y variables
+            R_arr: Rated power as a dense [i, s] array
+            c_arr: ToU prices as a dense [t] array
+            o_arr: Incentives as a dense [t] array
+            alpha: Time slot duration
+            
+        Returns:
+            coef, coef_x, coef_y: Lists aligned with keys
+        """
+        keys = np.array(keys, dtype=int).reshape(-1, 3)
+        coef = R_arr[keys[:, 0], keys[:, 2]]
+        coef_x = alpha * coef * c_arr[keys[:, 1]]
+        coef_y = -alpha * coef * o_arr[keys[:, 1]]
+        return coef.tolist(), coef_x.tolist(), coef_y.tolist()
     
     @staticmethod
-    def _add_budget_constraints(model, x, y, R, c, o, alpha, A, T, I, S):
-        """Add budget constraints"""
+    def _add_aggregate_constraints(model, x, y, e, PL, R_arr, c_arr, o_arr, alpha, A, T, S,
+                                   nonzero_c_slots, nonzero_o_slots):
+        """Add electricity consumption, peak load and budget constraints in a single pass"""
+        coefs, coefs_x, coefs_y = ModelBuilder._compute_budget_coefs(list(x.keys()), R_arr, c_arr, o_arr, alpha)
+        
+        # Budget terms only exist in slots with a non-zero price or incentive
+        has_price = [False] * (T + 1)
+        for t in nonzero_c_slots:
+            has_price[t] = True
+        has_incentive = [False] * (T + 1)
+        for t in nonzero_o_slots:
+            has_incentive[t] = True
+        
+        ec_terms = {t: [] for t in range(1, T + 1)}
+        budget_terms = {s: [] for s in range(1, S + 1)}
+        
+        for ((i, t, s), x_var), coef, coef_x, coef_y in zip(x.items(), coefs, coefs_x, coefs_y):
+            if not coef:
+                continue
+            ec_terms[t].append((x_var, coef))
+            if has_price[t]:
+                budget_terms[s].append((x_var, coef_x))
+            if has_incentive[t]:
+                budget_terms[s].append((y[(i, t, s)], coef_y))
+        
+        for t in range(1, T + 1):
+            model += (e[t] == pl.LpAffineExpression(ec_terms[t]),
+                     f"Electricity_Consumption_{t}")
+            model += (PL >= e[t], f"Peak_Load_{t}")
+        
         for s in range(1, S + 1):
-            model += (pl.lpSum([R.get((i, s), 0) * 
-                              (c.get(t, 0) * x[(i, t, s)] - 
-                               o.get(t, 0) * y[(i, t, s)]) * 
-                              alpha
-                             for t in range(1, T + 1)
-                             for i in range(1, I + 1)]) <= A[s],
+            model += (pl.LpAffineExpression(budget_terms[s]) <= A[s],
                      f"Budget_Constraint_{s}")
     
     @staticmethod
-    def _add_operation_duration_constraints(model, x, E, L, N, S, I):
+    def _add_operation_duration_constraints(model, x, E, L, N, R_keys):
         """Add operation duration constraints"""
-        for s in range(1, S + 1):
-            for i in range(1, I + 1):
-                if (i, s) in E and (i, s) in L:
-                    model += (pl.lpSum([x[(i, t, s)] 
-                                      for t in range(E[(i, s)], L[(i, s)] + 1)]) 
-                             >= N.get((i, s), 0),
-                            f"Operation_Duration_{i}_{s}")
+        for (i, s) in R_keys:
+            if (i, s) in E and (i, s) in L:
+                model += (pl.lpSum([x.get((i, t, s), 0) 
+                                  for t in range(E[(i, s)], L[(i, s)] + 1)]) 
+                         >= N.get((i, s), 0),
+                        f"Operation_Duration_{i}_{s}")
     
     @staticmethod
-    def _add_uninterruptible_operation_constraints(model, x, u, S, I, T):
+    def _add_uninterruptible_operation_constraints(model, x_mat, u_mat, S, I, T):
         """Add uninterruptible operation constraints"""
         for s in range(1, S + 1):
             for i in range(1, I + 1):
+                x_i = x_mat[i]
+                u_i = u_mat[i]
                 for t in range(1, T + 1):
+                    x_curr = x_i[t][s]
+                    x_prev = x_i[t-1][s]
+                    u_curr = u_i[t][s]
+                    
                     # Constraint (7)
-                    model += (x[(i, t, s)] <= 1 - u[(i, t, s)],
-                             f"Uninterruptible_1_{i}_{t}_{s}")
+                    if x_curr is not None:
+                        model += (x_curr <= 1 - u_curr,
+                                 f"Uninterruptible_1_{i}_{t}_{s}")
                     
                     # Constraint (8) - for t >= 2
-                    if t >= 2:
-                        model += (x[(i, t-1, s)] - x[(i, t, s)] <= u[(i, t, s)],
+                    if t >= 2 and (x_prev is not None or x_curr is not None):
+                        model += ((x_prev if x_prev is not None else 0)
+                                  - (x_curr if x_curr is not None else 0) <= u_curr,
                                  f"Uninterruptible_2_{i}_{t}_{s}")
                     
                     # Constraint (9) - for t >= 2
                     if t >= 2:
-                        model += (u[(i, t-1, s)] <= u[(i, t, s)],
+                        model += (u_i[t-1][s] <= u_curr,
                                  f"Uninterruptible_3_{i}_{t}_{s}")
     
     @staticmethod
-    def _add_machine_dependency_constraints(model, x, u, machine_dependencies, T):
+    def _add_machine_dependency_constraints(model, x_mat, u_mat, machine_dependencies, T):
         """Add machine dependency constraints"""
         for (i, s), i_star in machine_dependencies.items():
             for t in range(1, T + 1):
-                model += (x[(i, t, s)] <= u[(i_star, t, s)],
-                         f"Precedence_Constraint_{i}_{i_star}_{t}_{s}")
+                x_var = x_mat[i][t][s]
+                if x_var is not None:
+                    model += (x_var <= u_mat[i_star][t][s],
+                             f"Precedence_Constraint_{i}_{i_star}_{t}_{s}")
     
     @staticmethod
     def _add_incentive_constraints(model, x, y, S, I, T):
         """Add incentive constraints"""
-        for s in range(1, S + 1):
-            for i in range(1, I + 1):
-                for t in range(1, T + 1):
-                    model += (y[(i, t, s)] <= x[(i, t, s)], 
-                             f"Incentive_Constraint_{i}_{t}_{s}")
\ No newline at end of file
+        for (i, t, s), y_var in y.items():
+            model += (y_var <= x[(i, t, s)], 
+                     f"Incentive_Constraint_{i}_{t}_{s}")
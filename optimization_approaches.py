@@ -2,23 +2,124 @@
 Optimization Approaches module implementing various multi-objective optimization methods
 """
 
+import os
 import pulp as pl
 from model_builder import ModelBuilder
 from objectives import ObjectiveManager
 from results_manager import ResultExtractor
+from utils import ensure_directory_exists, save_pickle, load_pickle
 
 
 class OptimizationApproaches:
-    def __init__(self, data_manager):
+    # Bumped whenever the layout of the results dictionary changes, so that
+    # results cached by an older version are not reused
+    RESULTS_FORMAT_VERSION = 3
+    
+    # Whether the HiGHS command-line solver is installed, checked on first use
+    _highs_available = None
+    
+    def __init__(self, data_manager, cache_dir='cache'):
         """
         Initialize optimization approaches with data manager
         
         Args:
             data_manager: DataManager instance containing optimization parameters
+            cache_dir: Directory for cached results, or None to disable caching
         """
         self.data_manager = data_manager
+        self.cache_dir = cache_dir
+        self.input_hash = data_manager.get_input_hash()
         self.objective_manager = ObjectiveManager(data_manager)
         self.result_extractor = ResultExtractor(data_manager)
+        self.solver = self._create_solver()
+        self.warm_start_solver = self._create_solver(warm_start=True)
+        
+        self._base_model = None
+        self._ec_expression = None
+    
+    def set_solver_threads(self, threads):
+        """
+        Limit the number of threads each solve may use
+        
+        Args:
+            threads: Number of solver threads
+        """
+        self.solver = self._create_solver(threads=threads)
+        self.warm_start_solver = self._create_solver(warm_start=True, threads=threads)
+    
+    @classmethod
+    def _create_solver(cls, warm_start=False, threads=None):
+        """
+        Create the MILP solver used by all approaches
+        
+        HiGHS is used when available, with multi-threading enabled; otherwise
+        falls back to a multi-threaded CBC.
+        
+        Args:
+            warm_start: Whether to start from the current variable values
+            threads: Number of solver threads, all CPUs by default
+            
+        Returns:
+            PuLP solver instance
+        """
+        threads = max(1, threads or os.cpu_count() or 1)
+        solver = pl.HiGHS_CMD(msg=False, threads=threads, warmStart=warm_start,
+                              options=['presolve=on', 'parallel=on', 'mip_rel_gap=1e-4'])
+        if cls._highs_available is None:
+            cls._highs_available = bool(solver.available())
+            if not cls._highs_available:
+                print("HiGHS not available, falling back to CBC")
+        if cls._highs_available:
+            return solver
+        
+        return pl.PULP_CBC_CMD(msg=False, threads=threads, warmStart=warm_start)
+    
+    @property
+    def base_model(self):
+        """
+        Base model shared by all approaches
+        
+        All approaches use the same constraint set, so the base model is built
+        once, on first use, and cloned for each solve.
+        """
+        if self._base_model is None:
+            self._base_model = ModelBuilder.build_base_model(self.data_manager)
+        return self._base_model
+    
+    def _EC_expression(self, x, y):
+        """
+        Electricity cost expression over the base model variables
+        
+        Every clone of the base model shares the same x and y variables, so the
+        expression is built once and a copy is returned for each model.
+        """
+        if self._ec_expression is None:
+            self._ec_expression = self.objective_manager.calculate_EC_expression(x, y)
+        return self._ec_expression.copy()
+    
+    def _cache_path(self, approach_key):
+        """Path of the cached results for an approach on the current inputs and model"""
+        return os.path.join(self.cache_dir,
+                            f"{self.input_hash}_m{ModelBuilder.MODEL_VERSION}"
+                            f"_v{self.RESULTS_FORMAT_VERSION}_{approach_key}.pkl")
+    
+    def _load_cached_results(self, approach_key):
+        """Return previously saved results for unchanged inputs, if any"""
+        if self.cache_dir is None:
+            return None
+        
+        results = load_pickle(self._cache_path(approach_key))
+        if results is not None:
+            print(f"Using cached results for {approach_key}")
+        return results
+    
+    def _save_cached_results(self, approach_key, results):
+        """Save successful results so unchanged inputs can skip the solve"""
+        if self.cache_dir is None or results is None:
+            return
+        
+        ensure_directory_exists(self.cache_dir)
+        save_pickle(results, self._cache_path(approach_key))
     
     def solve_preemptive_EC_first(self):
         """
@@ -29,16 +130,20 @@ class OptimizationApproaches:
         """
         print("\n=== Solving with Preemptive Approach (EC First) ===")
         
+        cached = self._load_cached_results("PR_EC_First")
+        if cached is not None:
+            return cached
+        
         # Step 1: Optimize EC alone
         print("Step 1: Optimizing Electricity Cost (EC)...")
-        model1, x1, y1, u1, e1, PL1 = ModelBuilder.build_base_model(self.data_manager, "PR_EC_First_Step1")
+        model1, x1, y1, u1, e1, PL1 = ModelBuilder.clone_base(self.base_model, "PR_EC_First_Step1")
         
         # Objective function: Minimize electricity cost
-        electricity_cost = self.objective_manager.calculate_EC_expression(x1, y1)
+        electricity_cost = self._EC_expression(x1, y1)
         model1 += electricity_cost, "Electricity_Cost"
         
         # Solve the model
-        model1.solve(pl.PULP_CBC_CMD(msg=False))
+        model1.solve(self.solver)
         
         if model1.status != pl.LpStatusOptimal:
             print("No optimal solution found in Step 1")
@@ -49,19 +154,20 @@ class OptimizationApproaches:
         
         # Step 2: Optimize PL while maintaining optimal EC
         print("Step 2: Optimizing Peak Load (PL) while maintaining optimal EC...")
-        model2, x2, y2, u2, e2, PL2 = ModelBuilder.build_base_model(self.data_manager, "PR_EC_First_Step2")
+        model2, x2, y2, u2, e2, PL2 = ModelBuilder.clone_base(self.base_model, "PR_EC_First_Step2")
         
         # Add constraint to maintain optimal EC
-        model2 += (self.objective_manager.calculate_EC_expression(x2, y2) <= optimal_EC * 1.001, "Maintain_Optimal_EC")  # Allow 0.1% tolerance
+        model2 += (self._EC_expression(x2, y2) <= optimal_EC * 1.001, "Maintain_Optimal_EC")  # Allow 0.1% tolerance
         
         # Objective function: Minimize peak load
         model2 += PL2, "Peak_Load"
         
-        # Solve the model
-        model2.solve(pl.PULP_CBC_CMD(msg=False))
+        # Solve the model, starting from the Step 1 solution held by the shared variables
+        model2.solve(self.warm_start_solver)
         
         # Extract results
         results = self.result_extractor.extract_results(model2, x2, y2, e2, PL2, "PR_EC_First")
+        self._save_cached_results("PR_EC_First", results)
         if results:
             print(f"PR_EC_First completed. EC: {results['EC']:.2f}, PL: {results['PL']:.2f}")
         
@@ -76,15 +182,19 @@ class OptimizationApproaches:
         """
         print("\n=== Solving with Preemptive Approach (PL First) ===")
         
+        cached = self._load_cached_results("PR_PL_First")
+        if cached is not None:
+            return cached
+        
         # Step 1: Optimize PL alone
         print("Step 1: Optimizing Peak Load (PL)...")
-        model1, x1, y1, u1, e1, PL1 = ModelBuilder.build_base_model(self.data_manager, "PR_PL_First_Step1")
+        model1, x1, y1, u1, e1, PL1 = ModelBuilder.clone_base(self.base_model, "PR_PL_First_Step1")
         
         # Objective function: Minimize peak load
         model1 += PL1, "Peak_Load"
         
         # Solve the model
-        model1.solve(pl.PULP_CBC_CMD(msg=False))
+        model1.solve(self.solver)
         
         if model1.status != pl.LpStatusOptimal:
             print("No optimal solution found in Step 1")
@@ -95,20 +205,21 @@ class OptimizationApproaches:
         
         # Step 2: Optimize EC while maintaining optimal PL
         print("Step 2: Optimizing Electricity Cost (EC) while maintaining optimal PL...")
-        model2, x2, y2, u2, e2, PL2 = ModelBuilder.build_base_model(self.data_manager, "PR_PL_First_Step2")
+        model2, x2, y2, u2, e2, PL2 = ModelBuilder.clone_base(self.base_model, "PR_PL_First_Step2")
         
         # Add constraint to maintain optimal PL
         model2 += (PL2 <= optimal_PL * 1.001, "Maintain_Optimal_PL")  # Allow 0.1% tolerance
         
         # Objective function: Minimize electricity cost
-        electricity_cost = self.objective_manager.calculate_EC_expression(x2, y2)
+        electricity_cost = self._EC_expression(x2, y2)
         model2 += electricity_cost, "Electricity_Cost"
         
-        # Solve the model
-        model2.solve(pl.PULP_CBC_CMD(msg=False))
+        # Solve the model, starting from the Step 1 solution held by the shared variables
+        model2.solve(self.warm_start_solver)
         
         # Extract results
         results = self.result_extractor.extract_results(model2, x2, y2, e2, PL2, "PR_PL_First")
+        self._save_cached_results("PR_PL_First", results)
         if results:
             print(f"PR_PL_First completed. EC: {results['EC']:.2f}, PL: {results['PL']:.2f}")
         
@@ -127,14 +238,19 @@ class OptimizationApproaches:
         """
         print(f"\n=== Solving with Weighted Sum Approach (EC: {w_EC}, PL: {w_PL}) ===")
         
+        cache_key = f"Weighted_Sum_{w_EC}_{w_PL}"
+        cached = self._load_cached_results(cache_key)
+        if cached is not None:
+            return cached
+        
         # Get normalization factors
         EC_ideal, PL_ideal, EC_norm, PL_norm = self.objective_manager.get_normalization_factors()
         
         # Build model
-        model, x, y, u, e, PL = ModelBuilder.build_base_model(self.data_manager, "Weighted_Sum")
+        model, x, y, u, e, PL = ModelBuilder.clone_base(self.base_model, "Weighted_Sum")
         
         # Create electricity cost expression
-        electricity_cost = self.objective_manager.calculate_EC_expression(x, y)
+        electricity_cost = self._EC_expression(x, y)
         
         # Create normalized weighted objective
         # Convert objective expressions to relative deviations from ideal points
@@ -145,10 +261,11 @@ class OptimizationApproaches:
         model += weighted_objective, "Weighted_Objective"
         
         # Solve the model
-        model.solve(pl.PULP_CBC_CMD(msg=False))
+        model.solve(self.solver)
         
         # Extract results
         results = self.result_extractor.extract_results(model, x, y, e, PL, "Weighted_Sum")
+        self._save_cached_results(cache_key, results)
         if results:
             print(f"Weighted Sum completed. EC: {results['EC']:.2f}, PL: {results['PL']:.2f}")
         
@@ -167,6 +284,11 @@ class OptimizationApproaches:
         """
         print(f"\n=== Solving with Compromise Programming Approach (EC: {w_EC}, PL: {w_PL}) ===")
         
+        cache_key = f"Compromise_Programming_{w_EC}_{w_PL}"
+        cached = self._load_cached_results(cache_key)
+        if cached is not None:
+            return cached
+        
         # Get ideal points with fallback values
         print("Finding ideal points...")
         EC_ideal = self.objective_manager.get_EC_ideal() or 0.1  # Avoid division by zero
@@ -175,10 +297,10 @@ class OptimizationApproaches:
         print(f"EC ideal: {EC_ideal:.2f}, PL ideal: {PL_ideal:.2f}")
         
         # Build model
-        model, x, y, u, e, PL = ModelBuilder.build_base_model(self.data_manager, "Compromise_Programming")
+        model, x, y, u, e, PL = ModelBuilder.clone_base(self.base_model, "Compromise_Programming")
         
         # Create electricity cost expression
-        electricity_cost = self.objective_manager.calculate_EC_expression(x, y)
+        electricity_cost = self._EC_expression(x, y)
         
         # Create variables for deviations from ideal point
         max_dev = pl.LpVariable("Maximum_Deviation", lowBound=0)
@@ -192,10 +314,11 @@ class OptimizationApproaches:
         model += max_dev, "Minimize_Maximum_Deviation"
         
         # Solve the model
-        model.solve(pl.PULP_CBC_CMD(msg=False))
+        model.solve(self.solver)
         
         # Extract results
         results = self.result_extractor.extract_results(model, x, y, e, PL, "Compromise_Programming")
+        self._save_cached_results(cache_key, results)
         if results:
             print(f"Compromise Programming completed. EC: {results['EC']:.2f}, PL: {results['PL']:.2f}")
         
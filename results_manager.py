@@ -2,14 +2,19 @@
 Results Manager module for extracting, visualizing, and saving optimization results
 """
 
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 import os
 import datetime
+import weakref
 import pulp as pl
+from utils import dataframe_to_rows, ensure_directory_exists, SCHEDULE_PARQUET_PATH
 
 
 class ResultExtractor:
+    # Maximum number of models whose extracted results are kept
+    CACHE_SIZE = 8
+    
     def __init__(self, data_manager):
         """
         Initialize the result extractor
@@ -18,6 +23,33 @@ class ResultExtractor:
             data_manager: DataManager instance containing optimization parameters
         """
         self.data_manager = data_manager
+        
+        # Dense coefficient arrays aligned with the [i, t, s] solution arrays
+        self._R_arr = data_manager.R_arr
+        self._c_arr = data_manager.c_arr
+        self._o_arr = data_manager.o_arr
+        
+        # Extracted results keyed by (id(model), approach_name), oldest first;
+        # entries are dropped as soon as their model is garbage collected
+        self._cache = {}
+    
+    def clear_cache(self):
+        """Forget all previously extracted results, e.g. after re-solving a model"""
+        self._cache.clear()
+    
+    def _cache_results(self, cache_key, model, results):
+        """Remember extracted results while the model is alive, evicting the oldest entries"""
+        cache = self._cache
+        
+        def forget(model_ref):
+            cached = cache.get(cache_key)
+            if cached is not None and cached[0] is model_ref:
+                del cache[cache_key]
+        
+        cache.pop(cache_key, None)
+        cache[cache_key] = (weakref.ref(model, forget), model.status, results)
+        while len(cache) > self.CACHE_SIZE:
+            del cache[next(iter(cache))]
     
     def extract_results(self, model, x, y, e, PL, approach_name):
         """
@@ -37,88 +69,121 @@ class ResultExtractor:
             print(f"No optimal solution found for {approach_name}")
             return None
         
+        # Reuse results already extracted from this model, unless its status has changed
+        cache_key = (id(model), approach_name)
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            model_ref, status, results = cached
+            if model_ref() is model and status == model.status:
+                return self._copy_results(results)
+        
+        # Read the solution once into dense [i, t, s] arrays
+        x_val = self._solution_array(x)
+        y_val = self._solution_array(y)
+        
         # Calculate the electricity cost
-        EC = self._calculate_EC_value(x, y)
+        EC = self._calculate_EC_value(x_val, y_val)
         
         # Peak load
         peak_load = pl.value(PL)
         
         # Extract machine schedules
-        schedule = self._extract_schedule(x)
+        schedule = self._extract_schedule(x_val)
         
         # Calculate load profile
         load_profile = self._calculate_load_profile(e)
         
-        return {
+        results = {
             'EC': EC,
             'PL': peak_load,
-            'Schedule': pd.DataFrame(schedule),
+            'Schedule': schedule,
             'LoadProfile': load_profile
         }
+        self._cache_results(cache_key, model, results)
+        
+        return self._copy_results(results)
+    
+    @staticmethod
+    def _copy_results(results):
+        """Copy results so that callers cannot modify the cached schedule and load profile"""
+        return {
+            'EC': results['EC'],
+            'PL': results['PL'],
+            'Schedule': results['Schedule'].copy(deep=True),
+            'LoadProfile': results['LoadProfile'].copy()
+        }
+    
+    def _solution_array(self, variables):
+        """
+        Collect solved variable values into a dense [i, t, s] array
+        
+        Args:
+            variables: Dictionary of decision variables keyed by (i, t, s)
+            
+        Returns:
+            Array of variable values, zero where no variable exists
+        """
+        values = np.zeros((self.data_manager.I + 1, self.data_manager.T + 1, self.data_manager.S + 1))
+        if variables:
+            keys = np.array(list(variables.keys()))
+            values[keys[:, 0], keys[:, 1], keys[:, 2]] = [var.varValue or 0.0 for var in variables.values()]
+        return values
     
-    def _calculate_EC_value(self, x, y):
+    def _calculate_EC_value(self, x_val, y_val):
         """Calculate the actual electricity cost value"""
-        R = self.data_manager.R
-        c = self.data_manager.c
-        o = self.data_manager.o
         alpha = self.data_manager.alpha
-        S = self.data_manager.S
-        T = self.data_manager.T
-        I = self.data_manager.I
-        
-        cost = 0
-        for s in range(1, S + 1):
-            for i in range(1, I + 1):
-                for t in range(1, T + 1):
-                    if (i, s) in R:
-                        x_val = pl.value(x[(i, t, s)])
-                        y_val = pl.value(y[(i, t, s)])
-                        if x_val is not None and y_val is not None:
-                            cost += R.get((i, s), 0) * (c.get(t, 0) * x_val - o.get(t, 0) * y_val) * alpha
-        
-        return cost
+        
+        cost = np.einsum('its,is,t->', x_val, self._R_arr, self._c_arr)
+        incentive = np.einsum('its,is,t->', y_val, self._R_arr, self._o_arr)
+        return float(alpha * (cost - incentive))
     
-    def _extract_schedule(self, x):
-        """Extract the schedule from decision variables"""
-        schedule = []
-        S = self.data_manager.S
-        I = self.data_manager.I
+    def _extract_schedule(self, x_val, dense=False):
+        """
+        Extract the schedule from solved decision variable values
+        
+        Args:
+            x_val: Dense [i, t, s] array of solved x values
+            dense: Whether to include a row for every slot, including those in
+                which the machine is off
+            
+        Returns:
+            DataFrame with one row per (system, machine, time slot)
+        """
         T = self.data_manager.T
-        R = self.data_manager.R
-        
-        for s in range(1, S + 1):
-            for i in range(1, I + 1):
-                for t in range(1, T + 1):
-                    if (i, s) in R:  # Only include valid machine-system pairs
-                        status = pl.value(x[(i, t, s)])
-                        if status is not None and status > 0.5:  # Binary variable = 1
-                            schedule.append({
-                                'SystemID': s,
-                                'MachineID': i,
-                                'TimeSlot': t,
-                                'Status': 1,
-                                'Power': R.get((i, s), 0)
-                            })
-                        else:
-                            schedule.append({
-                                'SystemID': s,
-                                'MachineID': i,
-                                'TimeSlot': t,
-                                'Status': 0,
-                                'Power': 0
-                            })
+        
+        # One row per valid machine-system pair and time slot
+        keys = np.array(self.data_manager.R_keys, dtype=int).reshape(-1, 2)
+        i_col = np.repeat(keys[:, 0], T)
+        s_col = np.repeat(keys[:, 1], T)
+        t_col = np.tile(np.arange(1, T + 1), len(keys))
+        
+        status = (x_val[i_col, t_col, s_col] > 0.5).astype(np.int8)  # Binary variable = 1
+        if not dense:
+            # Only keep the slots in which a machine is on
+            on = status.astype(bool)
+            i_col, s_col, t_col, status = i_col[on], s_col[on], t_col[on], status[on]
+        power = self._R_arr[i_col, s_col] * status
+        
+        schedule = pd.DataFrame({
+            'SystemID': s_col,
+            'MachineID': i_col,
+            'TimeSlot': t_col,
+            'Status': status,
+            'Power': power
+        })
+        
+        # Use the narrowest integer types, as this is the largest results table
+        for column in ['SystemID', 'MachineID', 'TimeSlot', 'Status']:
+            schedule[column] = pd.to_numeric(schedule[column], downcast='integer')
         
         return schedule
     
     def _calculate_load_profile(self, e):
-        """Calculate the load profile from energy variables"""
+        """Calculate the load profile from energy variables as an array over time slots"""
         T = self.data_manager.T
-        load_profile = {}
-        
-        for t in range(1, T + 1):
-            load_profile[t] = pl.value(e[t])
         
-        return load_profile
+        # Aligned with time slots 1..T
+        return np.array([e[t].varValue for t in range(1, T + 1)], dtype=np.float64)
 
 
 class ResultsManager:
@@ -175,48 +240,57 @@ class ResultsManager:
             print("Not all approaches have been solved successfully.")
             return
         
+        # Matplotlib is only loaded when plots are actually produced
+        import matplotlib.pyplot as plt
+        
         # Plot load profiles
-        plt.figure(figsize=(14, 8))
+        # A single figure is reused for both plots and closed explicitly at the end
+        fig, ax = plt.subplots(figsize=(14, 8), layout="constrained")
         
         for approach, results in results_dict.items():
             load_profile = results['LoadProfile']
-            time_slots = list(load_profile.keys())
-            loads = list(load_profile.values())
-            plt.plot(time_slots, loads, label=f"{approach} (EC={results['EC']:.2f}, PL={results['PL']:.2f})")
+            ax.plot(np.arange(1, len(load_profile) + 1), load_profile, label=f"{approach} (EC={results['EC']:.2f}, PL={results['PL']:.2f})")
         
-        plt.xlabel('Time Slot')
-        plt.ylabel('Power (kW)')
-        plt.title('Load Profiles Comparison')
-        plt.legend()
-        plt.grid(True)
+        ax.set_xlabel('Time Slot')
+        ax.set_ylabel('Power (kW)')
+        ax.set_title('Load Profiles Comparison')
+        ax.legend()
+        ax.grid(True)
         
         # Save figure
         os.makedirs('results', exist_ok=True)
-        plt.savefig('results/load_profiles_comparison.png')
-        plt.close()
+        fig.savefig('results/load_profiles_comparison.png')
         
         # Plot objective values
         approaches = list(results_dict.keys())
         ec_values = [results['EC'] for results in results_dict.values()]
         pl_values = [results['PL'] for results in results_dict.values()]
         
-        plt.figure(figsize=(10, 6))
+        fig.clear()
+        fig.set_size_inches(10, 6)
+        ax = fig.add_subplot()
         x = np.arange(len(approaches))
         width = 0.35
         
-        plt.bar(x - width/2, ec_values, width, label='Electricity Cost')
-        plt.bar(x + width/2, pl_values, width, label='Peak Load')
+        ax.bar(x - width/2, ec_values, width, label='Electricity Cost')
+        ax.bar(x + width/2, pl_values, width, label='Peak Load')
         
-        plt.xlabel('Approach')
-        plt.ylabel('Value')
-        plt.title('Objective Values Comparison')
-        plt.xticks(x, approaches)
-        plt.legend()
-        plt.grid(True, axis='y')
+        ax.set_xlabel('Approach')
+        ax.set_ylabel('Value')
+        ax.set_title('Objective Values Comparison')
+        ax.set_xticks(x, approaches)
+        ax.legend()
+        ax.grid(True, axis='y')
         
         # Save figure
-        plt.savefig('results/objective_values_comparison.png')
-        plt.close()
+        fig.savefig('results/objective_values_comparison.png')
+        plt.close(fig)
+    
+    @staticmethod
+    def _remove_schedule_copy():
+        """Remove the local schedule copy used by the schedule formatter, if any"""
+        if os.path.exists(SCHEDULE_PARQUET_PATH):
+            os.remove(SCHEDULE_PARQUET_PATH)
     
     def save_results_to_sheets(self, results_dict):
         """
@@ -230,6 +304,10 @@ class ResultsManager:
         """
         print("\n=== Saving results to Google Sheets ===")
         
+        # Drop the local schedule copy from an earlier run, so the schedule formatter
+        # only ever reads the schedule of a save that succeeded
+        self._remove_schedule_copy()
+        
         if not all(results_dict.values()):
             print("Not all approaches have been solved successfully.")
             return False
@@ -249,20 +327,12 @@ class ResultsManager:
             
             comparison_df = pd.DataFrame(comparison)
             
-            # Save combined results to a single sheet
-            try:
-                results_sheet = self.data_manager.sheet.worksheet("OptimizationResults")
-                results_sheet.clear()
-            except Exception:
-                results_sheet = self.data_manager.sheet.add_worksheet(title="OptimizationResults", rows=20, cols=10)
-            
-            # Add timestamp
+            # Save combined results to a single sheet, with the comparison table only (without load profiles)
             timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            results_sheet.update_cell(1, 1, f"Multi-Objective Optimization Results - Generated on {timestamp}")
-            
-            # Add comparison table only (without load profiles)
-            results_sheet.update_cell(3, 1, "Comparison of Approaches")
-            results_sheet.update('A4', [comparison_df.columns.tolist()] + comparison_df.values.tolist())
+            comparison_data = [["Comparison of Approaches"], comparison_df.columns.tolist()] + dataframe_to_rows(comparison_df)
+            saved = self.data_manager.save_worksheet_data(
+                "OptimizationResults", comparison_data, rows=20, cols=10,
+                header_text=f"Multi-Objective Optimization Results - Generated on {timestamp}")
             
             # Save the optimized schedule from the selected approach
             # By default, use Weighted Sum (WS) or the first available approach
@@ -270,13 +340,23 @@ class ResultsManager:
             selected_schedule = results_dict[selected_approach]['Schedule']
             
             # Save to OptimizedSchedule sheet
+            schedule_data = [selected_schedule.columns.tolist()] + dataframe_to_rows(selected_schedule)
+            saved = self.data_manager.save_worksheet_data(
+                "OptimizedSchedule", schedule_data, rows=max(1000, len(schedule_data)), cols=10) and saved
+            
+            # Clear and write both sheets in one batch each over the existing connection
+            saved = self.data_manager.flush_writes() and saved
+            if not saved:
+                return False
+            
+            # Keep a local columnar copy for the schedule formatter once the sheets are saved
             try:
-                schedule_sheet = self.data_manager.sheet.worksheet("OptimizedSchedule")
-                schedule_sheet.clear()
-            except Exception:
-                schedule_sheet = self.data_manager.sheet.add_worksheet(title="OptimizedSchedule", rows=1000, cols=10)
+                ensure_directory_exists(os.path.dirname(SCHEDULE_PARQUET_PATH))
+                selected_schedule.to_parquet(SCHEDULE_PARQUET_PATH, compression='snappy', index=False)
+            except Exception as e:
+                print(f"Warning: Could not save local schedule copy: {e}")
+                self._remove_schedule_copy()
             
-            schedule_sheet.update([selected_schedule.columns.tolist()] + selected_schedule.values.tolist())
             print(f"Updated OptimizedSchedule sheet with {len(selected_schedule)} rows from {selected_approach} approach")
             
             print("Results saved to Google Sheets successfully!")
@@ -284,6 +364,4 @@ class ResultsManager:
         
         except Exception as e:
             print(f"Error saving results to sheets: {e}")
-            return False
-# Ensure numpy is imported for plotting
-import numpy as np
\ No newline at end of file
+            return False
\ No newline at end of file
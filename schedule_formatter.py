@@ -5,12 +5,12 @@ This script reads the OptimizedSchedule sheet from a Google Sheet and creates
 a new human-readable sheet showing when each machine should be turned on and off.
 """
 
+import os
 import pandas as pd
-import gspread
-from google.oauth2.service_account import Credentials
 import datetime
+import numbers
 import numpy as np
-from utils import convert_time_slot_to_time
+from utils import convert_time_slot_to_time, dataframe_to_rows, SCHEDULE_PARQUET_PATH
 
 
 class ScheduleFormatter:
@@ -28,6 +28,9 @@ class ScheduleFormatter:
         
     def connect_to_sheets(self):
         """Establish connection to Google Sheets"""
+        import gspread
+        from google.oauth2.service_account import Credentials
+        
         scope = ["https://www.googleapis.com/auth/spreadsheets"]
         creds = Credentials.from_service_account_file(self.credentials_file, scopes=scope)
         self.client = gspread.authorize(creds)
@@ -38,25 +41,65 @@ class ScheduleFormatter:
         """Load the required data from Google Sheets"""
         print("Loading data from Google Sheets...")
         
-        # Load optimized schedule
-        schedule_sheet = self.sheet.worksheet("OptimizedSchedule")
-        self.schedule_df = pd.DataFrame(schedule_sheet.get_all_records())
-        print(f"Loaded {len(self.schedule_df)} schedule entries")
+        # Fetch all worksheets in a single column-major batchGet request; the schedule
+        # is only fetched from the sheet when there is no local copy
+        schedule_columns = ['SystemID', 'MachineID', 'TimeSlot', 'Status', 'Power']
+        use_local_schedule = os.path.exists(SCHEDULE_PARQUET_PATH)
+        ranges = ["Machines", "ToUPrices", "SystemParams"]
+        if not use_local_schedule:
+            ranges.append("'OptimizedSchedule'!A:E")
+        
+        response = self.sheet.values_batch_get(
+            ranges=ranges,
+            params={"majorDimension": "COLUMNS", "valueRenderOption": "UNFORMATTED_VALUE"}
+        )
+        value_ranges = [value_range.get('values', []) for value_range in response['valueRanges']]
+        
+        # Load optimized schedule, preferring the local copy saved with the results
+        if use_local_schedule:
+            self.schedule_df = pd.read_parquet(SCHEDULE_PARQUET_PATH)
+            print(f"Loaded {len(self.schedule_df)} schedule entries from {SCHEDULE_PARQUET_PATH}")
+        else:
+            self.schedule_df = self._columns_to_dataframe(value_ranges[3], schedule_columns, schedule_columns)
+            print(f"Loaded {len(self.schedule_df)} schedule entries")
         
         # Load machine data for names
-        machine_sheet = self.sheet.worksheet("Machines")
-        self.machines_df = pd.DataFrame(machine_sheet.get_all_records())
+        self.machines_df = self._columns_to_dataframe(value_ranges[0], ['SystemID', 'MachineID', 'MachineName'],
+                                                      ['SystemID', 'MachineID'])
         print(f"Loaded {len(self.machines_df)} machine entries")
         
         # Load ToU data for time information
-        tou_sheet = self.sheet.worksheet("ToUPrices")
-        self.tou_df = pd.DataFrame(tou_sheet.get_all_records())
+        self.tou_df = self._columns_to_dataframe(value_ranges[1], ['TimeSlot', 'Price'], ['TimeSlot', 'Price'])
         
         # Get time slot duration (default 15 minutes)
-        system_sheet = self.sheet.worksheet("SystemParams")
-        system_params = pd.DataFrame(system_sheet.get_all_records())
+        system_params = self._columns_to_dataframe(value_ranges[2], ['Parameter', 'Value'])
         alpha_row = system_params[system_params['Parameter'] == 'alpha']
-        self.slot_duration_minutes = 60 * float(alpha_row['Value'].iloc[0]) if not alpha_row.empty else 15
+        self.slot_duration_minutes = 60 * float(alpha_row['Value'].iloc[0]) if not alpha_row.empty else 15.0
+    
+    @staticmethod
+    def _columns_to_dataframe(columns, keep, numeric_columns=()):
+        """
+        Build a DataFrame from column-major worksheet values
+        
+        Args:
+            columns: List of columns as returned by the Sheets values API, each
+                starting with its header cell
+            keep: Headers of the columns to keep, where present
+            numeric_columns: Columns to convert to numbers
+            
+        Returns:
+            DataFrame with the kept columns
+        """
+        selected = {column[0]: column[1:] for column in columns if column and column[0] in keep}
+        
+        # The API drops trailing empty cells, so pad short columns back to the longest one
+        length = max((len(values) for values in selected.values()), default=0)
+        df = pd.DataFrame({header: values + [None] * (length - len(values))
+                           for header, values in selected.items()})
+        for column in numeric_columns:
+            if column in df.columns:
+                df[column] = pd.to_numeric(df[column])
+        return df
     
     def format_schedule(self):
         """
@@ -67,91 +110,154 @@ class ScheduleFormatter:
         """
         print("Formatting schedule...")
         
-        # Create a dictionary to store machine names
-        machine_names = {}
-        for _, row in self.machines_df.iterrows():
-            key = (int(row['SystemID']), int(row['MachineID']))
-            name = row.get('MachineName', f"Machine {row['MachineID']}")
-            machine_names[key] = name
+        # Store machine operation periods column by column; machine names are
+        # attached afterwards in a single lookup
+        columns = [
+            'SystemID', 'MachineID', 'StartSlot', 'EndSlot', 
+            'StartTime', 'EndTime', 'DurationSlots', 'DurationMinutes', 
+            'Power', 'EnergyConsumption'
+        ]
+        operation_periods = {column: [] for column in columns}
         
-        # Create a list to store machine operation periods
-        operation_periods = []
-        
-        # Identify unique system-machine pairs
-        system_machines = self.schedule_df[['SystemID', 'MachineID']].drop_duplicates()
+        # Sort the schedule once and process each machine's rows as a group
+        schedule_df = self.schedule_df.copy()
+        for column in ['SystemID', 'MachineID', 'TimeSlot', 'Status']:
+            schedule_df[column] = pd.to_numeric(schedule_df[column], downcast='integer')
+        schedule_df = schedule_df.sort_values(['SystemID', 'MachineID', 'TimeSlot'])
         
         # Process each machine
-        for _, sm_row in system_machines.iterrows():
-            system_id = int(sm_row['SystemID'])
-            machine_id = int(sm_row['MachineID'])
-            
-            # Filter schedule for this machine
-            machine_schedule = self.schedule_df[
-                (self.schedule_df['SystemID'] == system_id) & 
-                (self.schedule_df['MachineID'] == machine_id)
-            ].sort_values('TimeSlot')
+        for (system_id, machine_id), machine_schedule in schedule_df.groupby(['SystemID', 'MachineID'], sort=False):
+            system_id = int(system_id)
+            machine_id = int(machine_id)
             
-            # Get machine name
-            machine_name = machine_names.get((system_id, machine_id), f"Machine {machine_id}")
+            # Find start and end times from runs of consecutive ON slots; the schedule
+            # may list every slot or only those in which the machine is on
+            on_schedule = machine_schedule[machine_schedule['Status'] == 1]
+            slots = on_schedule['TimeSlot'].to_numpy(dtype=np.int32)
+            breaks = np.flatnonzero(np.diff(slots) != 1) + 1
+            start_slots = slots[np.r_[0, breaks]].tolist() if len(slots) else []
+            end_slots = slots[np.r_[breaks - 1, len(slots) - 1]].tolist() if len(slots) else []
             
-            # Find start and end times
-            status_changes = []
-            prev_status = 0
+            # Get power consumption, which is the same for every period of the machine
+            power = on_schedule['Power'].iat[0].item() if len(on_schedule) else 0
             
-            for _, row in machine_schedule.iterrows():
-                time_slot = int(row['TimeSlot'])
-                status = int(row['Status'])
+            # Process the runs to find operation periods
+            for start_slot, end_slot in zip(start_slots, end_slots):
+                # Convert slots to time strings
+                start_time = convert_time_slot_to_time(start_slot, self.slot_duration_minutes)
+                end_time = convert_time_slot_to_time(end_slot + 1, self.slot_duration_minutes)  # +1 because we want the end of this slot
                 
-                if status != prev_status:
-                    status_changes.append((time_slot, status))
-                    prev_status = status
-            
-            # Process status changes to find operation periods
-            for i in range(0, len(status_changes) - 1, 2):
-                if i + 1 < len(status_changes):
-                    start_slot = status_changes[i][0]
-                    end_slot = status_changes[i+1][0] - 1  # The machine runs until the end of the previous slot
-                    
-                    # Convert slots to time strings
-                    start_time = convert_time_slot_to_time(start_slot, self.slot_duration_minutes)
-                    end_time = convert_time_slot_to_time(end_slot + 1, self.slot_duration_minutes)  # +1 because we want the end of this slot
-                    
-                    # Get power consumption
-                    power = 0
-                    power_row = machine_schedule[machine_schedule['Status'] == 1].iloc[0] if not machine_schedule[machine_schedule['Status'] == 1].empty else None
-                    if power_row is not None:
-                        power = power_row['Power']
-                    
-                    # Calculate duration in time slots and minutes
-                    duration_slots = end_slot - start_slot + 1
-                    duration_minutes = duration_slots * self.slot_duration_minutes
-                    
-                    # Add to operation periods
-                    operation_periods.append({
-                        'SystemID': system_id,
-                        'MachineID': machine_id,
-                        'MachineName': machine_name,
-                        'StartSlot': start_slot,
-                        'EndSlot': end_slot,
-                        'StartTime': start_time,
-                        'EndTime': end_time,
-                        'DurationSlots': duration_slots,
-                        'DurationMinutes': duration_minutes,
-                        'Power': power,
-                        'EnergyConsumption': power * (duration_slots * self.slot_duration_minutes / 60)  # kWh
-                    })
+                # Calculate duration in time slots and minutes
+                duration_slots = end_slot - start_slot + 1
+                duration_minutes = duration_slots * self.slot_duration_minutes
+                
+                # Add to operation periods
+                operation_periods['SystemID'].append(system_id)
+                operation_periods['MachineID'].append(machine_id)
+                operation_periods['StartSlot'].append(start_slot)
+                operation_periods['EndSlot'].append(end_slot)
+                operation_periods['StartTime'].append(start_time)
+                operation_periods['EndTime'].append(end_time)
+                operation_periods['DurationSlots'].append(duration_slots)
+                operation_periods['DurationMinutes'].append(duration_minutes)
+                operation_periods['Power'].append(power)
+                operation_periods['EnergyConsumption'].append(power * (duration_slots * self.slot_duration_minutes / 60))  # kWh
         
         # Convert to DataFrame
-        if operation_periods:
-            periods_df = pd.DataFrame(operation_periods)
-            return periods_df
-        else:
+        if not operation_periods['SystemID']:
             print("No operation periods found. Check if machines are scheduled to run.")
-            return pd.DataFrame(columns=[
-                'SystemID', 'MachineID', 'MachineName', 'StartSlot', 'EndSlot', 
-                'StartTime', 'EndTime', 'DurationSlots', 'DurationMinutes', 
-                'Power', 'EnergyConsumption'
-            ])
+        periods_df = pd.DataFrame(operation_periods, columns=columns)
+        for column in ['SystemID', 'MachineID', 'StartSlot', 'EndSlot', 'DurationSlots']:
+            periods_df[column] = pd.to_numeric(periods_df[column], downcast='integer')
+        periods_df.insert(2, 'MachineName', self._machine_names(periods_df))
+        return periods_df
+    
+    def _machine_names(self, periods_df):
+        """
+        Look up the machine name of every operation period
+        
+        Args:
+            periods_df: DataFrame with SystemID and MachineID columns
+            
+        Returns:
+            Series of machine names, defaulting to "Machine <MachineID>"
+        """
+        default_names = 'Machine ' + periods_df['MachineID'].astype(str)
+        if 'MachineName' not in self.machines_df.columns or periods_df.empty:
+            return default_names
+        
+        names = (self.machines_df
+                 .drop_duplicates(['SystemID', 'MachineID'], keep='last')
+                 .set_index(['SystemID', 'MachineID'])['MachineName'])
+        keys = pd.MultiIndex.from_frame(periods_df[['SystemID', 'MachineID']])
+        return pd.Series(keys.map(names), index=periods_df.index).fillna(default_names)
+    
+    @staticmethod
+    def _cell_data(value):
+        """Convert a Python value to Sheets API cell data"""
+        if value is None or (isinstance(value, float) and np.isnan(value)):
+            return {}
+        if isinstance(value, (bool, np.bool_)):
+            return {"userEnteredValue": {"boolValue": bool(value)}}
+        if isinstance(value, numbers.Number):
+            return {"userEnteredValue": {"numberValue": float(value)}}
+        return {"userEnteredValue": {"stringValue": str(value)}}
+    
+    def _update_cells_request(self, worksheet_id, row_index, column_index, values):
+        """
+        Build a batchUpdate request writing a block of values
+        
+        Args:
+            worksheet_id: ID of the worksheet to write to
+            row_index, column_index: Zero-based top-left cell of the block
+            values: List of rows to write
+        """
+        return {
+            "updateCells": {
+                "start": {"sheetId": worksheet_id, "rowIndex": row_index, "columnIndex": column_index},
+                "rows": [{"values": [self._cell_data(value) for value in row]} for row in values],
+                "fields": "userEnteredValue"
+            }
+        }
+    
+    @staticmethod
+    def _grid_size_request(worksheet, rows, cols):
+        """
+        Build a batchUpdate request growing a worksheet's grid to fit a block of values,
+        as updateCells does not add rows or columns itself
+        
+        Args:
+            worksheet: The worksheet to resize
+            rows, cols: Minimum number of rows and columns needed
+        """
+        return {
+            "updateSheetProperties": {
+                "properties": {
+                    "sheetId": worksheet.id,
+                    "gridProperties": {
+                        "rowCount": max(worksheet.row_count, rows),
+                        "columnCount": max(worksheet.col_count, cols)
+                    }
+                },
+                "fields": "gridProperties.rowCount,gridProperties.columnCount"
+            }
+        }
+    
+    def _open_worksheet(self, title, rows, cols):
+        """
+        Get a worksheet for rewriting, creating it if it doesn't exist
+        
+        Returns:
+            worksheet: The worksheet
+            requests: batchUpdate requests clearing its existing values
+        """
+        import gspread
+        
+        try:
+            worksheet = self.sheet.worksheet(title)
+            return worksheet, [{"updateCells": {"range": {"sheetId": worksheet.id}, "fields": "userEnteredValue"}}]
+        except gspread.exceptions.WorksheetNotFound:
+            return self.sheet.add_worksheet(title=title, rows=rows, cols=cols), []
     
     def save_formatted_schedule(self, periods_df):
         """
@@ -164,40 +270,37 @@ class ScheduleFormatter:
         
         try:
             # Create a new worksheet or clear existing one
-            try:
-                schedule_sheet = self.sheet.worksheet("MachineOperationSchedule")
-                schedule_sheet.clear()
-            except gspread.exceptions.WorksheetNotFound:
-                schedule_sheet = self.sheet.add_worksheet(title="MachineOperationSchedule", rows=len(periods_df) + 10, cols=15)
+            schedule_sheet, requests = self._open_worksheet("MachineOperationSchedule",
+                                                            rows=len(periods_df) + 10, cols=15)
             
             # Add timestamp
             timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            schedule_sheet.update_cell(1, 1, f"Machine Operation Schedule - Generated on {timestamp}")
+            requests.append(self._update_cells_request(
+                schedule_sheet.id, 0, 0, [[f"Machine Operation Schedule - Generated on {timestamp}"]]))
             
             # Prepare data
             header = periods_df.columns.tolist()
-            data = [header] + periods_df.values.tolist()
-            
-            # Update sheet
-            schedule_sheet.update('A3', data)
+            data = [header] + dataframe_to_rows(periods_df)
+            requests.append(self._grid_size_request(schedule_sheet, len(data) + 3, len(header)))
+            requests.append(self._update_cells_request(schedule_sheet.id, 2, 0, data))
             
-            # Format the sheet
-            try:
-                # Set the header row to bold
-                bold_format = {
-                    "textFormat": {
-                        "bold": True
-                    }
+            # Set the header row to bold
+            requests.append({
+                "repeatCell": {
+                    "range": {
+                        "sheetId": schedule_sheet.id,
+                        "startRowIndex": 2,
+                        "endRowIndex": 3,
+                        "startColumnIndex": 0,
+                        "endColumnIndex": len(header)
+                    },
+                    "cell": {"userEnteredFormat": {"textFormat": {"bold": True}}},
+                    "fields": "userEnteredFormat.textFormat.bold"
                 }
-                
-                # Format header row
-                header_cells = schedule_sheet.range(3, 1, 3, len(header))
-                for cell in header_cells:
-                    schedule_sheet.format(f"{cell.address}", bold_format)
-                
-                print("Formatted the header row")
-            except Exception as e:
-                print(f"Warning: Could not apply formatting: {str(e)}")
+            })
+            
+            # Write values and formatting in a single request
+            self.sheet.batch_update({"requests": requests})
             
             print(f"Saved machine operation schedule to 'MachineOperationSchedule' sheet")
             return True
@@ -218,15 +321,12 @@ class ScheduleFormatter:
         
         try:
             # Create a new worksheet or clear existing one
-            try:
-                daily_sheet = self.sheet.worksheet("DailyScheduleView")
-                daily_sheet.clear()
-            except gspread.exceptions.WorksheetNotFound:
-                daily_sheet = self.sheet.add_worksheet(title="DailyScheduleView", rows=50, cols=150)
+            daily_sheet, requests = self._open_worksheet("DailyScheduleView", rows=50, cols=150)
             
             # Add timestamp
             timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            daily_sheet.update_cell(1, 1, f"Daily Machine Schedule (10-min intervals) - Generated on {timestamp}")
+            requests.append(self._update_cells_request(
+                daily_sheet.id, 0, 0, [[f"Daily Machine Schedule (10-min intervals) - Generated on {timestamp}"]]))
             
             # Prepare the daily schedule
             # Header: 10-minute intervals throughout the day
@@ -237,90 +337,63 @@ class ScheduleFormatter:
                 for minute in range(0, 60, 10):
                     header.append(f"{hour:02d}:{minute:02d}")
             
-            # Create a row for each machine
+            # Create a row for each machine, numbering machines in order of appearance
             machines = periods_df[['SystemID', 'MachineID', 'MachineName']].drop_duplicates()
+            machine_index = periods_df.groupby(['SystemID', 'MachineID', 'MachineName'], sort=False).ngroup().to_numpy()
             
-            # Prepare data rows
-            data_rows = []
-            for _, machine in machines.iterrows():
-                system_id = machine['SystemID']
-                machine_id = machine['MachineID']
-                machine_name = machine['MachineName']
-                
-                # Initialize row with machine name
-                row = [f"System {system_id} - {machine_name}"]
-                
-                # Fill with spaces initially (144 intervals of 10 minutes in a day)
-                row.extend([""] * 144)
-                
-                # Get operation periods for this machine
-                machine_periods = periods_df[
-                    (periods_df['SystemID'] == system_id) & 
-                    (periods_df['MachineID'] == machine_id)
-                ]
-                
-                # Mark operation periods
-                for _, period in machine_periods.iterrows():
-                    start_time = period['StartTime']
-                    end_time = period['EndTime']
-                    
-                    # Extract hours and minutes
-                    start_hour = int(start_time.split(':')[0])
-                    start_minute = int(start_time.split(':')[1])
-                    end_hour = int(end_time.split(':')[0])
-                    end_minute = int(end_time.split(':')[1])
-                    
-                    # Calculate corresponding indices in the 10-minute grid
-                    start_index = (start_hour * 6) + (start_minute // 10)
-                    
-                    # For end time, round up to the next 10-minute slot if needed
-                    end_index = (end_hour * 6) + (end_minute // 10)
-                    if end_minute % 10 > 0:
-                        end_index += 1
-                    
-                    # Mark operation intervals
-                    for interval in range(start_index, end_index):
-                        if 0 <= interval < 144:  # Ensure within bounds
-                            row[interval + 1] = "ON"  # +1 because first column is machine name
-                
-                data_rows.append(row)
+            # 144 intervals of 10 minutes in a day, empty initially
+            grid = np.full((len(machines), 144), "", dtype='<U2')
+            
+            # Calculate corresponding indices in the 10-minute grid directly from the slot
+            # numbers, rounding the end up to the next 10-minute slot if needed. The slot
+            # columns are downcast, so widen them first to keep the minutes from overflowing
+            start_minutes = (periods_df['StartSlot'].to_numpy(dtype=np.int64) - 1) * self.slot_duration_minutes
+            end_minutes = periods_df['EndSlot'].to_numpy(dtype=np.int64) * self.slot_duration_minutes
+            start_indices = np.maximum(start_minutes // 10, 0).astype(int)
+            end_indices = np.minimum(-(-end_minutes // 10), 144).astype(int)  # Ensure within bounds
+            
+            # Mark operation intervals
+            for row_index, start_index, end_index in zip(machine_index.tolist(), start_indices.tolist(), end_indices.tolist()):
+                grid[row_index, start_index:end_index] = "ON"
+            
+            # Prepare data rows, starting with the machine name
+            labels = [f"System {system_id} - {machine_name}"
+                      for system_id, machine_name in zip(machines['SystemID'].tolist(), machines['MachineName'].tolist())]
+            data_rows = [[label] + cells for label, cells in zip(labels, grid.tolist())]
             
             # Combine header and data rows
             all_data = [header] + data_rows
             
-            # Update sheet
-            daily_sheet.update('A3', all_data)
+            requests.append(self._grid_size_request(daily_sheet, len(all_data) + 3, len(header)))
+            requests.append(self._update_cells_request(daily_sheet.id, 2, 0, all_data))
             
             # Apply conditional formatting for ON cells
-            try:
-                formatting_request = {
-                    "addConditionalFormatRule": {
-                        "rule": {
-                            "ranges": [{
-                                "sheetId": daily_sheet.id,
-                                "startRowIndex": 3,
-                                "endRowIndex": 3 + len(data_rows),
-                                "startColumnIndex": 1,
-                                "endColumnIndex": 145  # 144 intervals + 1 for machine name
-                            }],
-                            "booleanRule": {
-                                "condition": {
-                                    "type": "TEXT_EQ",
-                                    "values": [{"userEnteredValue": "ON"}]
-                                },
-                                "format": {
-                                    "backgroundColor": {"red": 0.7, "green": 0.9, "blue": 0.7}
-                                }
+            requests.append({
+                "addConditionalFormatRule": {
+                    "rule": {
+                        "ranges": [{
+                            "sheetId": daily_sheet.id,
+                            "startRowIndex": 3,
+                            "endRowIndex": 3 + len(data_rows),
+                            "startColumnIndex": 1,
+                            "endColumnIndex": 145  # 144 intervals + 1 for machine name
+                        }],
+                        "booleanRule": {
+                            "condition": {
+                                "type": "TEXT_EQ",
+                                "values": [{"userEnteredValue": "ON"}]
+                            },
+                            "format": {
+                                "backgroundColor": {"red": 0.7, "green": 0.9, "blue": 0.7}
                             }
-                        },
-                        "index": 0
-                    }
+                        }
+                    },
+                    "index": 0
                 }
-                
-                self.sheet.batch_update({"requests": [formatting_request]})
-                print("Applied conditional formatting")
-            except Exception as e:
-                print(f"Warning: Could not apply conditional formatting: {str(e)}")
+            })
+            
+            # Write values and formatting in a single request
+            self.sheet.batch_update({"requests": requests})
             
             print(f"Created daily schedule view in 'DailyScheduleView' sheet")
             return True
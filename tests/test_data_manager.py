@@ -0,0 +1,75 @@
+from unittest import mock
+
+import gspread
+
+from data_manager import DataManager
+
+
+def make_data_manager(worksheet_titles):
+    """Create a DataManager backed by a mocked Spreadsheet with gspread's real signatures"""
+    with mock.patch.object(DataManager, 'connect_to_sheets'):
+        data_manager = DataManager("sheet-id", "credentials.json")
+    
+    sheet = mock.create_autospec(gspread.Spreadsheet, instance=True)
+    worksheets = []
+    for title in worksheet_titles:
+        worksheet = mock.create_autospec(gspread.Worksheet, instance=True)
+        worksheet.title = title
+        worksheets.append(worksheet)
+    sheet.worksheets.return_value = worksheets
+    data_manager.sheet = sheet
+    return data_manager
+
+
+def test_flush_writes_clears_existing_worksheets_then_writes():
+    data_manager = make_data_manager(["OptimizationResults"])
+    
+    assert data_manager.save_worksheet_data("OptimizationResults", [["a", 1]], header_text="Header")
+    assert data_manager.save_worksheet_data("OptimizedSchedule", [["b", 2]])
+    assert data_manager.flush_writes()
+    
+    sheet = data_manager.sheet
+    sheet.add_worksheet.assert_called_once_with(title="OptimizedSchedule", rows=20, cols=10)
+    sheet.values_batch_clear.assert_called_once_with(body={'ranges': ["'OptimizationResults'"]})
+    sheet.values_batch_update.assert_called_once_with({
+        'valueInputOption': 'RAW',
+        'data': [
+            {'range': "'OptimizationResults'!A1", 'values': [["Header"], [], ["a", 1]]},
+            {'range': "'OptimizedSchedule'!A1", 'values': [["b", 2]]},
+        ]
+    })
+
+
+def test_flush_writes_without_queued_data_makes_no_requests():
+    data_manager = make_data_manager([])
+    
+    assert data_manager.flush_writes()
+    data_manager.sheet.values_batch_clear.assert_not_called()
+    data_manager.sheet.values_batch_update.assert_not_called()
+
+
+def test_load_data_with_empty_system_params():
+    data_manager = make_data_manager([])
+    data_manager.sheet.values_batch_get.return_value = {'valueRanges': [
+        {'values': [["MachineID"], [1]]},
+        {'values': [["TimeSlot", "Price"], [1, 0.1]]},
+        {},
+        {},
+    ]}
+    
+    with mock.patch.object(DataManager, 'parse_parameters'):
+        data_manager.load_data()
+    
+    assert data_manager.system_params == {}
+
+
+def test_parse_flag_accepts_common_spellings():
+    for value in (True, 1, 1.0, "1", "TRUE", "yes", " On "):
+        assert DataManager._parse_flag("flag", value, default=False) is True
+    for value in (False, 0, 0.0, "0", "FALSE", "no", "off"):
+        assert DataManager._parse_flag("flag", value, default=True) is False
+
+
+def test_parse_flag_falls_back_to_default():
+    for value in (None, "", "maybe", 2):
+        assert DataManager._parse_flag("flag", value, default=True) is True
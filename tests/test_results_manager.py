@@ -0,0 +1,34 @@
+import gc
+from types import SimpleNamespace
+
+import numpy as np
+import pulp as pl
+
+from results_manager import ResultExtractor
+
+
+def make_extractor():
+    data_manager = SimpleNamespace(R_arr=np.zeros((2, 2)), c_arr=np.zeros(2), o_arr=np.zeros(2))
+    return ResultExtractor(data_manager)
+
+
+def test_cached_results_are_dropped_with_their_model():
+    extractor = make_extractor()
+    model = pl.LpProblem("model")
+    
+    extractor._cache_results((id(model), "WS"), model, {})
+    assert len(extractor._cache) == 1
+    
+    del model
+    gc.collect()
+    assert extractor._cache == {}
+
+
+def test_cache_keeps_only_the_most_recent_models():
+    extractor = make_extractor()
+    models = [pl.LpProblem(f"model_{n}") for n in range(ResultExtractor.CACHE_SIZE + 2)]
+    
+    for model in models:
+        extractor._cache_results((id(model), "WS"), model, {})
+    
+    assert list(extractor._cache) == [(id(model), "WS") for model in models[2:]]
@@ -5,6 +5,12 @@ Utilities module containing helper functions for the optimization process
 import os
 import time
 import json
+import pickle
+from functools import lru_cache
+
+
+# Local copy of the optimized schedule, read by ScheduleFormatter in place of the sheet
+SCHEDULE_PARQUET_PATH = os.path.join('results', 'schedule.parquet')
 
 
 def ensure_directory_exists(directory_path):
@@ -14,8 +20,7 @@ def ensure_directory_exists(directory_path):
     Args:
         directory_path: Path to the directory
     """
-    if not os.path.exists(directory_path):
-        os.makedirs(directory_path)
+    os.makedirs(directory_path, exist_ok=True)
 
 
 def timing_decorator(func):
@@ -37,16 +42,20 @@ def timing_decorator(func):
     return wrapper
 
 
-def save_json(data, file_path):
+def save_json(data, file_path, human=False):
     """
     Save data to a JSON file
     
     Args:
         data: Data to save
         file_path: Path to save the file
+        human: Whether to indent the output for reading; compact otherwise
     """
-    with open(file_path, 'w') as f:
-        json.dump(data, f, indent=4)
+    with open(file_path, 'w', buffering=1 << 20) as f:
+        if human:
+            json.dump(data, f, indent=2)
+        else:
+            json.dump(data, f, separators=(',', ':'))
 
 
 def load_json(file_path):
@@ -66,6 +75,49 @@ def load_json(file_path):
         return json.load(f)
 
 
+def save_pickle(data, file_path):
+    """
+    Save data to a pickle file
+    
+    Args:
+        data: Data to save
+        file_path: Path to save the file
+    """
+    with open(file_path, 'wb') as f:
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_pickle(file_path):
+    """
+    Load data from a pickle file
+    
+    Args:
+        file_path: Path to the file
+        
+    Returns:
+        Loaded data or None if file doesn't exist
+    """
+    if not os.path.exists(file_path):
+        return None
+    
+    with open(file_path, 'rb') as f:
+        return pickle.load(f)
+
+
+def dataframe_to_rows(df):
+    """
+    Convert DataFrame rows to lists of native Python values
+    
+    Args:
+        df: DataFrame to convert
+        
+    Returns:
+        List of rows, with NumPy scalars converted to Python types
+    """
+    return [[value.item() if hasattr(value, 'item') else value for value in row]
+            for row in df.itertuples(index=False, name=None)]
+
+
 def format_results_for_display(results):
     """
     Format optimization results for display
@@ -92,14 +144,15 @@ def format_results_for_display(results):
     
     # Add load profile summary
     if 'LoadProfile' in results:
-        load_values = list(results['LoadProfile'].values())
-        output.append(f"- Average Load: {sum(load_values) / len(load_values):.2f} kW")
-        output.append(f"- Maximum Load: {max(load_values):.2f} kW")
-        output.append(f"- Minimum Load: {min(load_values):.2f} kW")
+        load_values = results['LoadProfile']
+        output.append(f"- Average Load: {load_values.mean():.2f} kW")
+        output.append(f"- Maximum Load: {load_values.max():.2f} kW")
+        output.append(f"- Minimum Load: {load_values.min():.2f} kW")
     
     return "\n".join(output)
 
 
+@lru_cache(maxsize=512)
 def convert_time_slot_to_time(time_slot, slot_duration_minutes=15):
     """
     Convert a time slot number to a time string (HH:MM)